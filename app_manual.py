@@ -3,11 +3,17 @@
 # Cole inteiro no arquivo app_manual.py
 
 import os
+import time
 import streamlit as st
-import pandas as pd
-import sqlite3
-from io import BytesIO
 from datetime import datetime
+from pathlib import Path
+
+# pandas and the utils modules are imported further down, only once the script
+# actually needs them, so the project picker paints without them (sqlite3 comes
+# in with utils.history as soon as a project is selected)
+_T_START = time.perf_counter()
+# set COMPARADOR_DEBUG_TIMINGS=1 to show and log script timings
+DEBUG_TIMINGS = os.environ.get("COMPARADOR_DEBUG_TIMINGS", "") not in ("", "0")
 
 # --- Config ---
 st.set_page_config(page_title="Comparador Manual de Inventário", layout="wide")
@@ -29,12 +35,13 @@ def _read_table(uploaded):
     df.columns = [str(c).strip() for c in df.columns]
     # drop Unnamed and empty-only columns
     df = df.loc[:, ~df.columns.str.contains(r"^Unnamed", na=False)]
-    non_empty = [c for c in df.columns if not df[c].astype(str).str.strip().eq("").all()]
+    # a column is blank iff the concatenation of its values is whitespace-only
+    non_empty = [c for c in df.columns if "".join(df[c].astype(str).tolist()).strip()]
     if non_empty:
         df = df[non_empty]
     return df
 
-def _find_column(df: pd.DataFrame, candidates):
+def _find_column(df: "pd.DataFrame", candidates):
     """Find best matching column name from candidates (exact case-insensitive, then contains)."""
     cols = list(df.columns)
     for cand in candidates:
@@ -48,21 +55,11 @@ def _find_column(df: pd.DataFrame, candidates):
     return None
 
 def generate_unique_codes(base_ids):
-    """Turn base_ids into unique codes by appending -01, -02 for duplicates."""
-    counts = {}
-    for b in base_ids:
-        b = str(b)
-        counts[b] = counts.get(b, 0) + 1
-    seq = {}
-    out = []
-    for b in base_ids:
-        b = str(b)
-        if counts.get(b, 0) <= 1 or b.strip() == "":
-            out.append(b)
-        else:
-            seq[b] = seq.get(b, 0) + 1
-            out.append(f"{b}-{seq[b]:02d}")
-    return out
+    """Turn base_ids into unique codes by appending -01, -02 for duplicates (blank ids are left as is)."""
+    s = pd.Series(base_ids, dtype=object).astype(str)
+    dup = s.duplicated(keep=False) & s.str.strip().ne("")
+    seq = s.groupby(s, sort=False).cumcount() + 1
+    return s.where(~dup, s + "-" + seq.astype(str).str.zfill(2)).tolist()
 
 def _safe(val):
     return "" if val is None else str(val)
@@ -72,6 +69,37 @@ def _ensure_project(name):
     os.makedirs(path, exist_ok=True)
     return path
 
+@st.cache_data(show_spinner=False)
+def _list_projects(dir_mtime):
+    """List project folders; cached per mtime of PROJECTS_DIR, which changes when a project is created or removed."""
+    with os.scandir(PROJECTS_DIR) as it:
+        return sorted(e.name for e in it if e.is_dir())
+
+@st.cache_resource
+def _startup_metrics():
+    """Script-to-picker time of the first run in this server process (Streamlit's own import is not included)."""
+    return {"first_run_ms": None}
+
+def _mark_first_paint():
+    """With DEBUG_TIMINGS, log and show how long this script run took to reach the project picker."""
+    if not DEBUG_TIMINGS:
+        return
+    elapsed_ms = (time.perf_counter() - _T_START) * 1000
+    metrics = _startup_metrics()
+    if metrics["first_run_ms"] is None:
+        metrics["first_run_ms"] = elapsed_ms
+    print(f"[timings] script -> seletor: {elapsed_ms:.1f} ms (primeira execução do processo: {metrics['first_run_ms']:.1f} ms)", flush=True)
+    st.sidebar.caption(
+        f"⏱️ Script até o seletor: {elapsed_ms:.0f} ms  |  primeira execução do processo: {metrics['first_run_ms']:.0f} ms"
+    )
+
+def _rerun():
+    # st.experimental_rerun was removed in newer Streamlit releases
+    if hasattr(st, "rerun"):
+        st.rerun()
+    else:
+        st.experimental_rerun()
+
 # ----------------- UI: Project selector -----------------
 st.sidebar.header("Projeto")
 mode = st.sidebar.radio("", ["Criar novo projeto", "Abrir projeto existente"])
@@ -84,18 +112,47 @@ if mode == "Criar novo projeto":
         else:
             _ensure_project(new_name.strip())
             st.sidebar.success(f"Projeto '{new_name.strip()}' criado. Agora escolha 'Abrir projeto existente'.")
-            st.experimental_rerun()
+            _rerun()
+    _mark_first_paint()
     st.stop()
 
 # Abrir existente
-projects = sorted([p for p in os.listdir(PROJECTS_DIR) if os.path.isdir(os.path.join(PROJECTS_DIR, p))])
+projects = _list_projects(os.stat(PROJECTS_DIR).st_mtime_ns)
 if not projects:
     st.sidebar.warning("Nenhum projeto encontrado. Crie um novo projeto primeiro.")
+    _mark_first_paint()
     st.stop()
 project_name = st.sidebar.selectbox("Selecione o projeto", projects)
+_mark_first_paint()
+
+from utils import history  # noqa: E402
+
 project_path = _ensure_project(project_name)
 st.sidebar.write(f"Pasta do projeto: {os.path.abspath(project_path)}")
 
+# shared multi-operator mode: pairings live in history.db (estado_pareamentos)
+# and every change is claimed there with optimistic versioning
+shared_mode = st.sidebar.checkbox("Modo multi-operador (estado compartilhado)", value=False)
+operador = "local"
+if shared_mode:
+    operador = st.sidebar.text_input("Nome do operador", value="local").strip() or "local"
+
+with st.sidebar.expander("Manutenção do histórico"):
+    history_db = Path(project_path) / "history.db"
+    if not history_db.exists():
+        st.caption("Nenhum histórico salvo ainda.")
+    else:
+        # counting snapshots scans the whole log, so only on demand
+        if st.button("Ver snapshots"):
+            st.caption(f"{len(history.list_snapshots(history_db))} snapshot(s) salvos")
+        keep_n = st.number_input("Snapshots datados a manter", min_value=0, value=5, step=1)
+        if st.button("🧹 Compactar histórico"):
+            rep_c = history.compact_history(history_db, int(keep_n))
+            st.success(
+                f"Linhas: {rep_c['linhas_antes']} → {rep_c['linhas_depois']}  |  "
+                f"Tamanho: {rep_c['bytes_antes'] / 1024:.1f} KB → {rep_c['bytes_depois'] / 1024:.1f} KB"
+            )
+
 st.title(f"Comparador Manual — Projeto: {project_name}")
 
 # ----------------- Uploads -----------------
@@ -110,6 +167,10 @@ if not (file_siga and file_form):
     st.info("Envie ambos os arquivos para começar (SIGA e Formulário).")
     st.stop()
 
+# heavy imports, deferred until there is data to load
+import sqlite3  # noqa: E402
+import pandas as pd  # noqa: E402
+
 # ----------------- Read and normalize -----------------
 try:
     siga_df = _read_table(file_siga)
@@ -163,17 +224,11 @@ form_df[form_obs_col] = form_df[form_obs_col].astype(str).str.strip()
 form_df[form_dep_col] = form_df[form_dep_col].astype(str).str.strip()
 
 # ----------------- Generate unique form codes when duplicates exist -----------------
-base_ids = form_df[form_code_col].astype(str).tolist()
-base_ids_normalized = [b if b.strip() != "" else f"__FROW__{i}" for i, b in enumerate(base_ids)]
-unique_codes = generate_unique_codes(base_ids_normalized)
-final_codes = []
-auto_counter = 1
-for orig, uniq in zip(base_ids, unique_codes):
-    if orig.strip() != "":
-        final_codes.append(uniq)
-    else:
-        final_codes.append(f"FORM-{auto_counter:05d}")
-        auto_counter += 1
+base_ids = form_df[form_code_col].astype(str)
+blank_ids = base_ids.str.strip().eq("")
+final_codes = pd.Series(generate_unique_codes(base_ids.tolist()), index=form_df.index)
+# rows without an id get sequential FORM-00001, FORM-00002, ...
+final_codes[blank_ids] = [f"FORM-{i:05d}" for i in range(1, int(blank_ids.sum()) + 1)]
 form_df["codigo_form"] = final_codes
 
 # ----------------- Visual columns -----------------
@@ -184,10 +239,8 @@ siga_df["dependencia_siga"] = siga_df[siga_dep_col]
 form_df["nome_form"] = form_df[form_name_col]
 form_df["observacao_form"] = form_df[form_obs_col]
 form_df["dependencia_form"] = form_df[form_dep_col]
-form_df["nome_visual"] = form_df.apply(
-    lambda r: f"{_safe(r['nome_form'])}" + (f" — {_safe(r['observacao_form'])}" if str(r['observacao_form']).strip() else ""),
-    axis=1
-)
+_obs = form_df["observacao_form"].astype(str)
+form_df["nome_visual"] = form_df["nome_form"].astype(str) + (" — " + _obs).where(_obs.str.strip().ne(""), "")
 siga_df["nome_visual"] = siga_df["nome_siga"]
 
 # ----------------- Column visibility controls -----------------
@@ -223,32 +276,98 @@ if "selections" not in st.session_state:
     st.session_state.selections = {}  # codigo_siga -> codigo_form
 if "selected_forms" not in st.session_state:
     st.session_state.selected_forms = set()
+if "shared_sync" not in st.session_state:
+    st.session_state.shared_sync = {"projeto": None, "revisao": 0, "versoes": {}, "reset": set()}
 
 # prefill from history if exists
 db_path = os.path.join(project_path, "history.db")
-if os.path.exists(db_path):
+
+def _saved_selections():
+    if not os.path.exists(db_path):
+        return {}
     try:
-        conn = sqlite3.connect(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT codigo_siga, codigo_form FROM pareamentos ORDER BY id")
-        rows = cur.fetchall()
-        for r in rows:
-            cs, cf = r
-            if cs and cf:
-                # restore last saved mapping if not already in session
-                if cs not in st.session_state.selections:
-                    st.session_state.selections[cs] = cf
-                    st.session_state.selected_forms.add(cf)
-        conn.close()
+        # latest saved row per codigo_siga only (indexed), not the whole log
+        return history.load_latest_state(Path(db_path))
     except Exception:
-        pass
+        return {}
+
+shared_changed = set()
+if shared_mode:
+    sync = st.session_state.shared_sync
+    if sync["projeto"] != project_name:
+        # switching project, first sync or re-enabling the mode: start from a full pull.
+        # Local choices made outside shared mode were never claimed, so their widgets are reset too.
+        shared_changed |= set(st.session_state.selections)
+        sync.update({"projeto": project_name, "revisao": 0, "versoes": {}, "reset": set()})
+        st.session_state.selections = {}
+        st.session_state.selected_forms = set()
+        history.seed_estado(Path(db_path), _saved_selections(), usuario=operador)
+    # pull only the rows changed by any operator since our last sync
+    delta = history.load_estado_desde(Path(db_path), sync["revisao"])
+    for linha in delta["linhas"]:
+        cs, cf = linha["codigo_siga"], linha["codigo_form"]
+        sync["versoes"][cs] = linha["versao"]
+        old = st.session_state.selections.get(cs, "")
+        if old == cf:
+            continue
+        if old:
+            st.session_state.selected_forms.discard(old)
+        if cf:
+            st.session_state.selections[cs] = cf
+            st.session_state.selected_forms.add(cf)
+        else:
+            st.session_state.selections.pop(cs, None)
+        shared_changed.add(cs)
+    sync["revisao"] = delta["revisao"]
+    shared_changed |= sync["reset"]
+    sync["reset"] = set()
+    if sync.get("aviso"):
+        st.warning(sync.pop("aviso"))
+else:
+    # leaving shared mode: force a full resync if it is turned back on
+    st.session_state.shared_sync["projeto"] = None
+    for cs, cf in _saved_selections().items():
+        # restore last saved mapping if not already in session
+        if cs not in st.session_state.selections:
+            st.session_state.selections[cs] = cf
+            st.session_state.selected_forms.add(cf)
 
 # pre-generate formatted option strings
-form_df["option_display"] = form_df.apply(
-    lambda r: f"{r['codigo_form']} — {r['nome_visual']}" + (f"  |  Dep: {r['dependencia_form']}" if str(r['dependencia_form']).strip() else ""),
-    axis=1
+_dep = form_df["dependencia_form"].astype(str)
+form_df["option_display"] = (
+    form_df["codigo_form"].astype(str) + " — " + form_df["nome_visual"].astype(str)
+    + ("  |  Dep: " + _dep).where(_dep.str.strip().ne(""), "")
 )
 
+# lowercased text of every form column, computed once instead of per SIGA row
+form_search = form_df.astype(str).apply(lambda col: col.str.lower())
+if global_search:
+    mask_global = form_search.apply(lambda col: col.str.contains(global_search, na=False)).any(axis=1)
+    form_opts = form_df[mask_global]
+else:
+    form_opts = form_df
+
+# fuzzy suggestions, cached per project in sugestoes.db (only changed texts are rescored)
+sugestoes = {}
+if st.checkbox("💡 Mostrar sugestões automáticas (rapidfuzz)", value=False):
+    from utils import sugestoes as sug
+    siga_textos = dict(zip(siga_df["codigo_siga"].astype(str), siga_df["nome_siga"].astype(str)))
+    form_textos = dict(zip(form_df["codigo_form"].astype(str), form_df["nome_form"].astype(str)))
+    # the cache is only consulted when the uploads change, not on every widget rerun
+    chave_sug = (project_name, sug.chave_entrada(siga_textos, form_textos))
+    memo = st.session_state.get("sugestoes_memo")
+    if memo and memo["chave"] == chave_sug:
+        sugestoes = memo["sugestoes"]
+    else:
+        barra = st.progress(0.0)
+        cache_sug = sug.atualizar_sugestoes(
+            Path(project_path) / "sugestoes.db", siga_textos.values(), form_textos.values(),
+            progresso=lambda feitos, total: barra.progress(feitos / total)
+        )
+        barra.empty()
+        sugestoes = sug.sugestoes_por_codigo(siga_textos, form_textos, cache_sug)
+        st.session_state.sugestoes_memo = {"chave": chave_sug, "sugestoes": sugestoes}
+
 pareados_for_export = []
 
 # iterate SIGA rows for manual pairing
@@ -266,15 +385,15 @@ for idx, srow in siga_df.reset_index(drop=True).iterrows():
         st.markdown(f"✅ **(Pareado)** {header_line}")
     else:
         st.markdown(f"🔸 {header_line}")
+    sugs = [(cf, sc) for cf, sc in sugestoes.get(codigo_siga, []) if cf not in st.session_state.selected_forms]
+    if sugs:
+        st.caption("💡 Sugestões: " + "  ·  ".join(f"{cf} ({sc:.0f})" for cf, sc in sugs[:3]))
 
     filtro = st.text_input("🔎 Filtrar opções (por código/nome/obs/dep):", key=f"filtro_{idx}", value="").strip().lower()
 
-    df_opts = form_df.copy()
-    if global_search:
-        mask_global = df_opts.apply(lambda r: r.astype(str).str.lower().str.contains(global_search, na=False)).any(axis=1)
-        df_opts = df_opts[mask_global]
+    df_opts = form_opts
     if filtro:
-        mask_row = df_opts.apply(lambda r: r.astype(str).str.lower().str.contains(filtro, na=False)).any(axis=1)
+        mask_row = form_search.loc[df_opts.index].apply(lambda col: col.str.contains(filtro, na=False)).any(axis=1)
         df_opts = df_opts[mask_row]
 
     # exclude already selected codes (one-to-one)
@@ -297,6 +416,10 @@ for idx, srow in siga_df.reset_index(drop=True).iterrows():
             options = ["(Nenhum)", prev_fmt] + [o for o in options[1:] if prev not in o]
             index_default = 1
 
+    if codigo_siga in shared_changed:
+        # another operator changed this row: drop the stale widget value
+        st.session_state.pop(f"sel_{idx}", None)
+
     sel = st.selectbox("Selecionar item do formulário para parear:", options, key=f"sel_{idx}", index=index_default)
 
     chosen_code = None
@@ -308,6 +431,22 @@ for idx, srow in siga_df.reset_index(drop=True).iterrows():
 
     # manage session_state.selected_forms to enforce one-to-one
     prev_code = st.session_state.selections.get(codigo_siga, "")
+    if shared_mode and (chosen_code or "") != prev_code:
+        sync = st.session_state.shared_sync
+        res = history.claim_pareamento(
+            Path(db_path), codigo_siga, chosen_code or "",
+            versao_esperada=sync["versoes"].get(codigo_siga, 0), usuario=operador
+        )
+        if res["ok"]:
+            sync["versoes"][codigo_siga] = res["linha"]["versao"]
+        else:
+            quem = (res["linha"] or {}).get("usuario") or "outro operador"
+            if res["motivo"] == "form_em_uso":
+                sync["aviso"] = f"{chosen_code} já foi pareado por outro operador. Seleção de {codigo_siga} desfeita."
+            else:
+                sync["aviso"] = f"{codigo_siga} foi alterado por {quem}. Estado atualizado, revise a seleção."
+            sync["reset"].add(codigo_siga)
+            _rerun()
     if prev_code and prev_code != chosen_code:
         if prev_code in st.session_state.selected_forms:
             st.session_state.selected_forms.discard(prev_code)
@@ -375,12 +514,20 @@ with col_a:
                         r.get("nome_form",""),
                         r.get("observacao_form",""),
                         r.get("dependencia_form",""),
-                        "local",
+                        operador,
                         now
                     )
                 )
             conn.commit()
             conn.close()
+            if not shared_mode and history.estado_ativo(Path(db_path)):
+                # solo save on a project that has shared state: push the saved rows there,
+                # otherwise the next shared session would pull (and re-save) stale pairings
+                history.replace_estado(
+                    Path(db_path),
+                    {r["codigo_siga"]: r.get("codigo_form", "") for r in pareados_for_export if r.get("codigo_siga")},
+                    usuario=operador, parcial=True
+                )
             st.success(f"Pareamentos salvos em: {os.path.join(project_path, 'history.db')}")
 
 with col_b:
@@ -1,4 +1,7 @@
 # utils/history.py
+import argparse
+import csv
+import os
 import sqlite3
 from datetime import datetime
 from pathlib import Path
@@ -21,6 +24,15 @@ CREATE TABLE IF NOT EXISTS pareamentos (
 );
 """
 
+# Índices de manutenção/restauração; criados à parte porque bancos gravados
+# pelo app podem ter a tabela pareamentos sem a coluna projeto.
+INDEX_SCHEMA = """
+CREATE INDEX IF NOT EXISTS ix_pareamentos_siga_id ON pareamentos (codigo_siga, id);
+CREATE INDEX IF NOT EXISTS ix_pareamentos_timestamp ON pareamentos (timestamp);
+"""
+
+SNAPSHOT_COLS = ["codigo_siga", "nome_siga", "observacao_siga", "dependencia_siga", "codigo_form", "nome_form", "observacao_form", "dependencia_form", "usuario", "timestamp"]
+
 def ensure_db(db_path: Path):
     db_path.parent.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(str(db_path))
@@ -94,3 +106,433 @@ def clear_project(db_path: Path, projeto: str):
         conn.commit()
     finally:
         conn.close()
+
+# ---------------------------------------------------------
+# Estado compartilhado (modo multi-operador)
+# ---------------------------------------------------------
+# Uma linha por codigo_siga com o pareamento vigente. Cada alteração incrementa
+# a versão da linha (concorrência otimista) e recebe uma revisão global
+# crescente, usada pelas sessões para puxar apenas as mudanças desde a última
+# sincronização. O índice único parcial garante o 1-para-1 entre sessões.
+ESTADO_SCHEMA = """
+CREATE TABLE IF NOT EXISTS estado_pareamentos (
+    codigo_siga TEXT PRIMARY KEY,
+    codigo_form TEXT NOT NULL DEFAULT '',
+    versao INTEGER NOT NULL,
+    revisao INTEGER NOT NULL,
+    usuario TEXT,
+    timestamp TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_estado_codigo_form
+    ON estado_pareamentos (codigo_form) WHERE codigo_form <> '';
+CREATE INDEX IF NOT EXISTS ix_estado_revisao ON estado_pareamentos (revisao);
+"""
+
+ESTADO_COLS = ["codigo_siga", "codigo_form", "versao", "revisao", "usuario", "timestamp"]
+
+def _connect_estado(db_path: Path) -> sqlite3.Connection:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    # isolation_level=None: as transações são abertas explicitamente com
+    # BEGIN IMMEDIATE, que reserva a escrita antes da leitura das versões.
+    conn = sqlite3.connect(str(db_path), timeout=10, isolation_level=None)
+    conn.executescript(ESTADO_SCHEMA)
+    return conn
+
+def load_estado_desde(db_path: Path, revisao: int = 0) -> Dict[str, Any]:
+    """
+    Retorna as linhas do estado compartilhado alteradas depois de `revisao`.
+    Resultado: {"revisao": <maior revisão conhecida>, "linhas": [dict, ...]}
+    Com revisao=0 devolve o estado completo (primeira sincronização).
+    """
+    conn = _connect_estado(db_path)
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT codigo_siga, codigo_form, versao, revisao, usuario, timestamp "
+            "FROM estado_pareamentos WHERE revisao > ? ORDER BY revisao",
+            (revisao,)
+        )
+        linhas = [dict(zip(ESTADO_COLS, r)) for r in cur.fetchall()]
+        nova_revisao = linhas[-1]["revisao"] if linhas else revisao
+        return {"revisao": nova_revisao, "linhas": linhas}
+    finally:
+        conn.close()
+
+def claim_pareamento(db_path: Path, codigo_siga: str, codigo_form: str,
+                     versao_esperada: int, usuario: str = "local") -> Dict[str, Any]:
+    """
+    Grava codigo_siga -> codigo_form no estado compartilhado se a versão da linha
+    ainda for `versao_esperada` (0 = linha ainda não existe). codigo_form vazio
+    libera o pareamento.
+
+    Retorna {"ok": bool, "motivo": str, "linha": dict | None}. Em caso de
+    conflito, "linha" traz o estado atual de codigo_siga para a sessão se
+    atualizar; motivo é "versao" (outro operador alterou o item SIGA) ou
+    "form_em_uso" (o item do formulário já está pareado com outro SIGA).
+    """
+    codigo_form = codigo_form or ""
+    conn = _connect_estado(db_path)
+    try:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.execute(
+                "SELECT codigo_siga, codigo_form, versao, revisao, usuario, timestamp "
+                "FROM estado_pareamentos WHERE codigo_siga = ?",
+                (codigo_siga,)
+            )
+            atual = cur.fetchone()
+            atual = dict(zip(ESTADO_COLS, atual)) if atual else None
+            versao_atual = atual["versao"] if atual else 0
+            if versao_atual != versao_esperada:
+                cur.execute("ROLLBACK")
+                return {"ok": False, "motivo": "versao", "linha": atual}
+            if codigo_form:
+                cur.execute(
+                    "SELECT codigo_siga FROM estado_pareamentos WHERE codigo_form = ? AND codigo_siga <> ?",
+                    (codigo_form, codigo_siga)
+                )
+                if cur.fetchone():
+                    cur.execute("ROLLBACK")
+                    return {"ok": False, "motivo": "form_em_uso", "linha": atual}
+            cur.execute("SELECT COALESCE(MAX(revisao), 0) + 1 FROM estado_pareamentos")
+            revisao = cur.fetchone()[0]
+            now = datetime.utcnow().isoformat(timespec="seconds")
+            linha = {
+                "codigo_siga": codigo_siga,
+                "codigo_form": codigo_form,
+                "versao": versao_atual + 1,
+                "revisao": revisao,
+                "usuario": usuario,
+                "timestamp": now,
+            }
+            cur.execute(
+                "INSERT OR REPLACE INTO estado_pareamentos (codigo_siga, codigo_form, versao, revisao, usuario, timestamp) VALUES (?,?,?,?,?,?)",
+                tuple(linha[c] for c in ESTADO_COLS)
+            )
+            cur.execute("COMMIT")
+            return {"ok": True, "motivo": "", "linha": linha}
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+def seed_estado(db_path: Path, selections: Dict[str, str], usuario: str = "local") -> bool:
+    """
+    Popula o estado compartilhado a partir de um mapeamento codigo_siga -> codigo_form
+    (ex.: o último histórico salvo), apenas se o estado ainda estiver vazio.
+    Retorna True se populou.
+    """
+    conn = _connect_estado(db_path)
+    try:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.execute("SELECT 1 FROM estado_pareamentos LIMIT 1")
+            if cur.fetchone():
+                cur.execute("ROLLBACK")
+                return False
+            now = datetime.utcnow().isoformat(timespec="seconds")
+            usados = set()
+            revisao = 0
+            for cs, cf in selections.items():
+                if not cs or not cf or cf in usados:
+                    continue
+                usados.add(cf)
+                revisao += 1
+                cur.execute(
+                    "INSERT INTO estado_pareamentos (codigo_siga, codigo_form, versao, revisao, usuario, timestamp) VALUES (?,?,?,?,?,?)",
+                    (cs, cf, 1, revisao, usuario, now)
+                )
+            cur.execute("COMMIT")
+            return revisao > 0
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+def estado_ativo(db_path: Path) -> bool:
+    """True se o projeto já usou o modo multi-operador (estado_pareamentos existe e tem linhas)."""
+    if not Path(db_path).exists():
+        return False
+    conn = sqlite3.connect(str(db_path))
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'estado_pareamentos'")
+        if not cur.fetchone():
+            return False
+        cur.execute("SELECT 1 FROM estado_pareamentos LIMIT 1")
+        return cur.fetchone() is not None
+    finally:
+        conn.close()
+
+def replace_estado(db_path: Path, selections: Dict[str, str], usuario: str = "local",
+                   parcial: bool = False) -> int:
+    """
+    Substitui o estado compartilhado por um mapeamento codigo_siga -> codigo_form
+    completo (ex.: um snapshot restaurado). Itens ausentes do mapeamento são
+    liberados. Com parcial=True (ex.: um "Salvar" fora do modo multi-operador)
+    só as chaves informadas mudam, e outros itens só são liberados se estiverem
+    com um codigo_form que o mapeamento atribui. Cada linha alterada recebe
+    versao+1 e uma nova revisão, então as sessões abertas recebem a mudança na
+    próxima sincronização e claims feitos com a versão antiga são recusados.
+    Retorna o número de linhas alteradas.
+    """
+    alvo, usados = {}, set()
+    for cs, cf in selections.items():
+        cf = cf or ""
+        if cf and cf in usados:
+            cf = ""
+        if cf:
+            usados.add(cf)
+        alvo[cs] = cf
+    conn = _connect_estado(db_path)
+    try:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.execute("SELECT codigo_siga, codigo_form, versao FROM estado_pareamentos")
+            atual = {cs: (cf, v) for cs, cf, v in cur.fetchall()}
+            if parcial:
+                final = {cs: cf for cs, (cf, _) in atual.items()}
+                for cs, (cf, _) in atual.items():
+                    if cs not in alvo and cf in usados:
+                        final[cs] = ""
+                final.update(alvo)
+                alvo = final
+            mudancas = [cs for cs in set(atual) | set(alvo)
+                        if alvo.get(cs, "") != atual.get(cs, ("", 0))[0]]
+            if not mudancas:
+                cur.execute("ROLLBACK")
+                return 0
+            # libera primeiro, para o índice único de codigo_form não acusar trocas entre linhas
+            cur.executemany("UPDATE estado_pareamentos SET codigo_form = '' WHERE codigo_siga = ?",
+                            [(cs,) for cs in mudancas])
+            cur.execute("SELECT COALESCE(MAX(revisao), 0) FROM estado_pareamentos")
+            revisao = cur.fetchone()[0]
+            now = datetime.utcnow().isoformat(timespec="seconds")
+            linhas = []
+            for cs in sorted(mudancas):
+                revisao += 1
+                linhas.append((cs, alvo.get(cs, ""), atual.get(cs, ("", 0))[1] + 1, revisao, usuario, now))
+            cur.executemany(
+                "INSERT OR REPLACE INTO estado_pareamentos (codigo_siga, codigo_form, versao, revisao, usuario, timestamp) VALUES (?,?,?,?,?,?)",
+                linhas
+            )
+            cur.execute("COMMIT")
+            return len(linhas)
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+# ---------------------------------------------------------
+# Manutenção do histórico (snapshots, compactação)
+# ---------------------------------------------------------
+# Cada clique em "Salvar" grava um snapshot completo com o mesmo timestamp;
+# o estado vigente de um codigo_siga é a linha mais recente (maior id).
+
+def _connect_log(db_path: Path) -> sqlite3.Connection:
+    ensure_db(db_path)
+    conn = sqlite3.connect(str(db_path))
+    conn.executescript(INDEX_SCHEMA)
+    return conn
+
+def load_latest_state(db_path: Path) -> Dict[str, str]:
+    """
+    Retorna o último pareamento salvo de cada codigo_siga (codigo_siga -> codigo_form),
+    lendo apenas a linha mais recente por item via índice. Itens cujo último
+    snapshot está sem pareamento ficam de fora; um codigo_form aparece no
+    máximo uma vez (prevalece o snapshot mais recente).
+    """
+    conn = _connect_log(db_path)
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT codigo_siga, codigo_form FROM pareamentos "
+            "WHERE id IN (SELECT MAX(id) FROM pareamentos GROUP BY codigo_siga) "
+            "ORDER BY id DESC"
+        )
+        state, usados = {}, set()
+        for cs, cf in cur.fetchall():
+            if cs and cf and cf not in usados:
+                state[cs] = cf
+                usados.add(cf)
+        return state
+    finally:
+        conn.close()
+
+def list_snapshots(db_path: Path) -> List[Dict[str, Any]]:
+    """Lista os snapshots salvos (mais recente primeiro): timestamp, linhas e pareados."""
+    conn = _connect_log(db_path)
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT timestamp, COUNT(*), SUM(CASE WHEN codigo_form <> '' THEN 1 ELSE 0 END) "
+            "FROM pareamentos GROUP BY timestamp ORDER BY timestamp DESC"
+        )
+        return [{"timestamp": t, "linhas": n, "pareados": p or 0} for t, n, p in cur.fetchall()]
+    finally:
+        conn.close()
+
+def compact_history(db_path: Path, keep_snapshots: int = 5) -> Dict[str, Any]:
+    """
+    Reduz o log ao estado vigente (última linha de cada codigo_siga) mais os
+    `keep_snapshots` snapshots mais recentes, e depois roda VACUUM/ANALYZE.
+    Retorna tamanhos (bytes) e número de linhas antes e depois.
+    """
+    conn = _connect_log(db_path)
+    try:
+        cur = conn.cursor()
+        size_before = os.path.getsize(db_path)
+        cur.execute("SELECT COUNT(*) FROM pareamentos")
+        rows_before = cur.fetchone()[0]
+        cur.execute(
+            "DELETE FROM pareamentos "
+            "WHERE id NOT IN (SELECT MAX(id) FROM pareamentos GROUP BY codigo_siga) "
+            "AND timestamp NOT IN (SELECT DISTINCT timestamp FROM pareamentos ORDER BY timestamp DESC LIMIT ?)",
+            (max(int(keep_snapshots), 0),)
+        )
+        conn.commit()
+        cur.execute("SELECT COUNT(*) FROM pareamentos")
+        rows_after = cur.fetchone()[0]
+        cur.execute("VACUUM")
+        cur.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    return {
+        "linhas_antes": rows_before,
+        "linhas_depois": rows_after,
+        "bytes_antes": size_before,
+        "bytes_depois": os.path.getsize(db_path),
+    }
+
+def _snapshot_rows(cur, timestamp: str) -> List[tuple]:
+    cur.execute(
+        "SELECT " + ", ".join(SNAPSHOT_COLS) + " FROM pareamentos WHERE timestamp = ? ORDER BY id",
+        (timestamp,)
+    )
+    return cur.fetchall()
+
+def export_snapshot(db_path: Path, dest: Path, timestamp: Optional[str] = None) -> int:
+    """
+    Exporta um snapshot (padrão: o mais recente) para CSV. Retorna o número de linhas.
+    """
+    conn = _connect_log(db_path)
+    try:
+        cur = conn.cursor()
+        if timestamp is None:
+            cur.execute("SELECT MAX(timestamp) FROM pareamentos")
+            timestamp = cur.fetchone()[0]
+        rows = _snapshot_rows(cur, timestamp) if timestamp else []
+    finally:
+        conn.close()
+    Path(dest).parent.mkdir(parents=True, exist_ok=True)
+    with open(dest, "w", newline="", encoding="utf-8-sig") as f:
+        w = csv.writer(f)
+        w.writerow(SNAPSHOT_COLS)
+        w.writerows(rows)
+    return len(rows)
+
+def _append_snapshot(conn: sqlite3.Connection, rows: List[Dict[str, Any]], usuario: str) -> int:
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    cols = SNAPSHOT_COLS[:-2]
+    conn.executemany(
+        "INSERT INTO pareamentos (" + ", ".join(cols) + ", usuario, timestamp) VALUES (" + ",".join("?" * (len(cols) + 2)) + ")",
+        [tuple(r.get(c, "") or "" for c in cols) + (usuario, now) for r in rows]
+    )
+    conn.commit()
+    return len(rows)
+
+def _sync_estado_com_snapshot(db_path: Path, rows: List[Dict[str, Any]], usuario: str):
+    # projetos que nunca usaram o modo multi-operador ficam sem estado: ele é
+    # semeado do log (já com o snapshot restaurado) quando o modo for ligado
+    if not estado_ativo(db_path):
+        return
+    # a última linha de cada codigo_siga vale, como em load_latest_state
+    selections = {}
+    for r in rows:
+        if r.get("codigo_siga"):
+            selections[r["codigo_siga"]] = r.get("codigo_form") or ""
+    replace_estado(db_path, selections, usuario)
+
+def restore_snapshot(db_path: Path, timestamp: str, usuario: str = "local") -> int:
+    """
+    Torna um snapshot antigo o estado vigente, regravando suas linhas com um
+    novo timestamp (o histórico anterior é preservado). O estado compartilhado
+    do modo multi-operador passa a refletir o snapshot (ver replace_estado).
+    Retorna o número de linhas.
+    """
+    conn = _connect_log(db_path)
+    try:
+        cur = conn.cursor()
+        rows = [dict(zip(SNAPSHOT_COLS, r)) for r in _snapshot_rows(cur, timestamp)]
+        if not rows:
+            raise ValueError(f"Snapshot não encontrado: {timestamp}")
+        n = _append_snapshot(conn, rows, usuario)
+    finally:
+        conn.close()
+    _sync_estado_com_snapshot(db_path, rows, usuario)
+    return n
+
+def import_snapshot(db_path: Path, src: Path, usuario: str = "local") -> int:
+    """
+    Regrava como snapshot vigente um CSV gerado por export_snapshot e atualiza
+    o estado compartilhado, como restore_snapshot. Retorna o número de linhas.
+    """
+    with open(src, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.DictReader(f))
+    conn = _connect_log(db_path)
+    try:
+        n = _append_snapshot(conn, rows, usuario)
+    finally:
+        conn.close()
+    _sync_estado_com_snapshot(db_path, rows, usuario)
+    return n
+
+def _fmt_bytes(n: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manutenção do history.db de um projeto")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("compact", help="mantém o estado vigente + N snapshots, VACUUM/ANALYZE")
+    p.add_argument("db", type=Path)
+    p.add_argument("--manter", type=int, default=5, help="snapshots datados a manter (padrão: 5)")
+    p = sub.add_parser("snapshots", help="lista os snapshots salvos")
+    p.add_argument("db", type=Path)
+    p = sub.add_parser("export", help="exporta um snapshot para CSV")
+    p.add_argument("db", type=Path)
+    p.add_argument("dest", type=Path)
+    p.add_argument("--timestamp", default=None, help="padrão: o mais recente")
+    p = sub.add_parser("restore", help="torna um snapshot salvo o estado vigente")
+    p.add_argument("db", type=Path)
+    p.add_argument("timestamp")
+    p = sub.add_parser("import", help="regrava um CSV exportado como estado vigente")
+    p.add_argument("db", type=Path)
+    p.add_argument("src", type=Path)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "compact":
+        r = compact_history(args.db, args.manter)
+        print(f"linhas: {r['linhas_antes']} -> {r['linhas_depois']}")
+        print(f"tamanho: {_fmt_bytes(r['bytes_antes'])} -> {_fmt_bytes(r['bytes_depois'])}")
+    elif args.cmd == "snapshots":
+        for snap in list_snapshots(args.db):
+            print(f"{snap['timestamp']}  linhas={snap['linhas']}  pareados={snap['pareados']}")
+    elif args.cmd == "export":
+        print(f"{export_snapshot(args.db, args.dest, args.timestamp)} linhas exportadas para {args.dest}")
+    elif args.cmd == "restore":
+        print(f"{restore_snapshot(args.db, args.timestamp)} linhas restauradas")
+    elif args.cmd == "import":
+        print(f"{import_snapshot(args.db, args.src)} linhas importadas")
+
+if __name__ == "__main__":
+    main()
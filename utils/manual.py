@@ -1,6 +1,5 @@
 import pandas as pd
 import os
-from openpyxl import Workbook
 
 # ---------------------------------------------------------
 # ✅ LIMPAR COLUNAS UNNAMED
@@ -65,6 +64,9 @@ def preparar_dados_para_visual(df_siga, df_form):
 # ✅ GERAR EXCEL COMPLETO (Várias abas)
 # ---------------------------------------------------------
 def gerar_excel_completo(df_siga, df_form, pareamentos):
+    # openpyxl só é carregado quando um Excel é de fato gerado
+    from openpyxl import Workbook
+
     caminho = "comparacao_completa.xlsx"
     wb = Workbook()
     ws1 = wb.active
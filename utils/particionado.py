@@ -0,0 +1,488 @@
+# utils/particionado.py
+# Pareamento automático fora da memória (out-of-core) para inventários grandes.
+#
+# 1. SIGA e formulário (CSV) são lidos em blocos e gravados num SQLite de
+#    trabalho, com a dependência normalizada como chave de partição.
+# 2. Os códigos do formulário recebem o mesmo tratamento do app
+#    (duplicados -> -01, -02; vazios -> FORM-00001) via funções de janela.
+# 3. Pareamentos manuais do history.db do projeto (opcional) são aplicados antes.
+# 4. Cada dependência é pareada isoladamente. Textos normalizados idênticos
+#    são pareados primeiro, por contagem, direto no SQL. Para o resto, a matriz
+#    de scores (rapidfuzz, todos os núcleos) é calculada em blocos que cabem no
+#    orçamento de memória, os candidatos vão para o disco e a atribuição
+#    1-para-1 é gulosa por score, marcada direto nas tabelas. Empates no k-ésimo
+#    score são mantidos (até EMPATES_MAX, em rodízio pelo rid), para que itens
+#    SIGA parecidos não disputem os mesmos k candidatos. Itens SIGA cujos
+#    candidatos foram todos tomados são pontuados de novo contra o que sobrou,
+#    com k dobrando a cada rodada, até não haver mais pares.
+# 5. Pareados / Somente_SIGA / Somente_Formulario são anexados em CSV a cada
+#    partição concluída.
+#
+# Uso:
+#   python -m utils.particionado siga.csv form.csv --saida resultado/ --memoria-mb 512
+import argparse
+import codecs
+import csv
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.sugestoes import normalizar_texto
+
+SIGA_CANDIDATOS = {
+    "codigo": ["Código", "Codigo", "CODIGO", "Cód. Item", "ID", "Cod"],
+    "nome": ["Nome", "Nome do Bem", "Descrição", "Descricao", "Item", "ITEM"],
+    "dependencia": ["Dependência", "Dependencia", "Localidade", "Local"],
+}
+FORM_CANDIDATOS = {
+    "codigo": ["Submission ID", "SubmissionID", "codigo_form", "codigo_formulario", "ID", "id"],
+    "nome": ["Nome / Tipo de Bens", "Nome", "name", "Item", "Tipo"],
+    "dependencia": ["Dependência / Localização", "Dependência", "Dependencia", "Local"],
+}
+
+STAGING_SCHEMA = """
+DROP TABLE IF EXISTS siga;
+DROP TABLE IF EXISTS form;
+DROP TABLE IF EXISTS candidatos;
+DROP TABLE IF EXISTS colunas;
+DROP TABLE IF EXISTS pendentes;
+CREATE TABLE siga (
+    rid INTEGER PRIMARY KEY,
+    dep TEXT, codigo TEXT, texto TEXT, dados TEXT,
+    par_form INTEGER, score REAL, origem TEXT
+);
+CREATE TABLE form (
+    rid INTEGER PRIMARY KEY,
+    dep TEXT, codigo_base TEXT, codigo TEXT, texto TEXT, dados TEXT,
+    pareado INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE candidatos (siga_rid INTEGER, form_rid INTEGER, score REAL);
+CREATE TABLE colunas (lado TEXT, posicao INTEGER, nome TEXT);
+CREATE TABLE pendentes (rid INTEGER PRIMARY KEY);
+"""
+
+STAGING_INDEXES = """
+CREATE INDEX ix_siga_dep ON siga (dep);
+CREATE INDEX ix_siga_codigo ON siga (codigo);
+CREATE INDEX ix_form_dep ON form (dep);
+CREATE INDEX ix_form_codigo ON form (codigo);
+"""
+
+# estimativa de memória por linha de texto carregada (string + listas Python)
+BYTES_POR_LINHA = 300
+# por célula da matriz: score float32 + cópia do np.partition + máscara de candidatos
+BYTES_POR_CELULA = 12
+# teto de linhas do formulário por bloco, para os blocos SIGA não ficarem minúsculos
+BLOCO_FORM_MAX = 100_000
+# candidatos guardados por item SIGA antes da atribuição 1-para-1 (primeira rodada)
+TOP_K = 3
+# teto de candidatos por item SIGA quando há empate no k-ésimo score
+EMPATES_MAX = 64
+# pares acumulados antes de gravar as marcações no SQLite
+BLOCO_PARES = 10_000
+
+def encontrar_coluna(colunas: List[str], candidatos: List[str]) -> Optional[str]:
+    """Mesma regra do app: igualdade sem caixa, depois 'contém'."""
+    for cand in candidatos:
+        for c in colunas:
+            if c.strip().lower() == cand.strip().lower():
+                return c
+    for cand in candidatos:
+        for c in colunas:
+            if cand.strip().lower() in c.strip().lower():
+                return c
+    return None
+
+def _detectar_encoding(path: Path) -> str:
+    """utf-8 se o arquivo inteiro decodifica como utf-8, senão latin-1 (como o app). Lê em blocos."""
+    dec = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(path, "rb") as f:
+            for parte in iter(lambda: f.read(1 << 20), b""):
+                dec.decode(parte)
+            dec.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return "latin-1"
+    return "utf-8"
+
+def _ler_blocos(path: Path, bloco: int):
+    import pandas as pd
+    return pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=bloco, encoding=_detectar_encoding(path))
+
+def _preparar_bloco(df, mapa: Dict[str, Optional[str]]):
+    df = df.fillna("")
+    df.columns = [str(c).strip() for c in df.columns]
+    df = df.loc[:, ~df.columns.str.contains(r"^Unnamed", na=False)]
+    for col in mapa.values():
+        if col is not None:
+            df[col] = df[col].astype(str).str.strip()
+    return df
+
+def _valores(df, col: Optional[str]) -> List[str]:
+    return df[col].tolist() if col is not None else [""] * len(df)
+
+def _carregar_lado(conn: sqlite3.Connection, lado: str, path: Path, candidatos: Dict[str, List[str]], bloco: int) -> int:
+    mapa = None
+    total = 0
+    for df in _ler_blocos(path, bloco):
+        if mapa is None:
+            colunas = [str(c).strip() for c in df.columns if not str(c).strip().startswith("Unnamed")]
+            # colunas não encontradas ficam vazias, como nos fallbacks do app
+            mapa = {chave: encontrar_coluna(colunas, cands) for chave, cands in candidatos.items()}
+            conn.executemany("INSERT INTO colunas (lado, posicao, nome) VALUES (?,?,?)",
+                             [(lado, i, c) for i, c in enumerate(colunas)])
+        df = _preparar_bloco(df, mapa)
+        dep = [normalizar_texto(d) for d in _valores(df, mapa["dependencia"])]
+        texto = [normalizar_texto(t) for t in _valores(df, mapa["nome"])]
+        # um json.dumps por linha: to_json(lines=True).splitlines() quebraria registros
+        # com U+0085/U+2028 (ex.: "…" 0x85 em arquivos latin-1)
+        dados = [json.dumps(r, ensure_ascii=False) for r in df.to_dict("records")]
+        if mapa["codigo"] is None:
+            # sem coluna de código: número da linha, como o reset_index do app
+            codigos = [str(i) for i in range(total, total + len(df))]
+        else:
+            codigos = _valores(df, mapa["codigo"])
+        if not (len(dep) == len(texto) == len(dados) == len(codigos) == len(df)):
+            raise ValueError(f"{path}: bloco com {len(df)} linhas gerou colunas de tamanhos diferentes")
+        if lado == "siga":
+            conn.executemany("INSERT INTO siga (dep, codigo, texto, dados) VALUES (?,?,?,?)",
+                             zip(dep, codigos, texto, dados))
+        else:
+            conn.executemany("INSERT INTO form (dep, codigo_base, texto, dados) VALUES (?,?,?,?)",
+                             zip(dep, codigos, texto, dados))
+        conn.commit()
+        total += len(df)
+    return total
+
+def _gerar_codigos_form(conn: sqlite3.Connection):
+    """Mesmo resultado de generate_unique_codes + FORM-NNNNN do app."""
+    conn.executescript("""
+        UPDATE form SET codigo = c.novo FROM (
+            SELECT rid, CASE WHEN COUNT(*) OVER (PARTITION BY codigo_base) > 1
+                        THEN codigo_base || '-' || printf('%02d', ROW_NUMBER() OVER (PARTITION BY codigo_base ORDER BY rid))
+                        ELSE codigo_base END AS novo
+            FROM form WHERE trim(codigo_base) <> ''
+        ) AS c WHERE form.rid = c.rid;
+        UPDATE form SET codigo = c.novo FROM (
+            SELECT rid, printf('FORM-%05d', ROW_NUMBER() OVER (ORDER BY rid)) AS novo
+            FROM form WHERE trim(codigo_base) = ''
+        ) AS c WHERE form.rid = c.rid;
+    """)
+    conn.commit()
+
+def _aplicar_manuais(conn: sqlite3.Connection, historico: Path) -> int:
+    """
+    Aplica o último pareamento de cada codigo_siga do history.db (mesma regra de
+    load_latest_state: sem pareamento fica de fora, cada codigo_form vale para o
+    snapshot mais recente) sem trazer o histórico para a memória: o banco é
+    anexado e tudo é feito em SQL.
+    """
+    cur = conn.cursor()
+    cur.execute("ATTACH DATABASE ? AS hist", (str(historico),))
+    try:
+        cur.execute("SELECT 1 FROM hist.sqlite_master WHERE type = 'table' AND name = 'pareamentos'")
+        if cur.fetchone() is None:
+            return 0
+        cur.executescript("""
+            DROP TABLE IF EXISTS temp.manuais;
+            CREATE TEMP TABLE manuais AS
+            SELECT (SELECT MIN(rid) FROM siga WHERE codigo = e.codigo_siga AND par_form IS NULL) AS siga_rid,
+                   (SELECT MIN(rid) FROM form WHERE codigo = e.codigo_form AND pareado = 0) AS form_rid
+            FROM (
+                SELECT codigo_siga, codigo_form,
+                       ROW_NUMBER() OVER (PARTITION BY codigo_form ORDER BY id DESC) AS n
+                FROM hist.pareamentos
+                WHERE id IN (SELECT MAX(id) FROM hist.pareamentos GROUP BY codigo_siga)
+                  AND codigo_siga <> '' AND codigo_form <> ''
+            ) AS e WHERE e.n = 1;
+            DELETE FROM manuais WHERE siga_rid IS NULL OR form_rid IS NULL;
+            DELETE FROM manuais WHERE rowid NOT IN (SELECT MIN(rowid) FROM manuais GROUP BY form_rid);
+        """)
+        cur.execute("UPDATE siga SET par_form = m.form_rid, origem = 'manual' FROM manuais AS m WHERE siga.rid = m.siga_rid")
+        n = cur.rowcount
+        cur.execute("UPDATE form SET pareado = 1 WHERE rid IN (SELECT form_rid FROM manuais)")
+        cur.execute("DROP TABLE manuais")
+        conn.commit()
+        return n
+    finally:
+        cur.execute("DETACH DATABASE hist")
+
+def _parear_identicos(conn: sqlite3.Connection, dep: str) -> int:
+    """Pareia por contagem os textos normalizados idênticos da partição (o n-ésimo SIGA com o n-ésimo form, por rid)."""
+    cur = conn.cursor()
+    cur.execute("""
+        UPDATE siga SET par_form = x.form_rid, score = 100.0, origem = 'automatico' FROM (
+            -- agrupa em vez de juntar as subconsultas: junção entre elas não tem índice
+            SELECT MAX(siga_rid) AS siga_rid, MAX(form_rid) AS form_rid FROM (
+                SELECT texto, ROW_NUMBER() OVER (PARTITION BY texto ORDER BY rid) AS n,
+                       rid AS siga_rid, NULL AS form_rid
+                FROM siga WHERE dep = ? AND par_form IS NULL AND texto <> ''
+                UNION ALL
+                SELECT texto, ROW_NUMBER() OVER (PARTITION BY texto ORDER BY rid) AS n,
+                       NULL, rid
+                FROM form WHERE dep = ? AND pareado = 0 AND texto <> ''
+            ) GROUP BY texto, n HAVING COUNT(*) = 2
+        ) AS x WHERE siga.rid = x.siga_rid
+    """, (dep, dep))
+    n = cur.rowcount
+    if n:
+        cur.execute("UPDATE form SET pareado = 1 WHERE dep = ? AND pareado = 0 AND rid IN "
+                    "(SELECT par_form FROM siga WHERE dep = ? AND par_form IS NOT NULL)", (dep, dep))
+    conn.commit()
+    return n
+
+def _selecionar(matriz, s_rid, k: int, limiar: float):
+    """
+    (linhas, colunas) dos candidatos de cada linha da matriz: os k melhores e
+    todos os empatados com o k-ésimo score, até EMPATES_MAX. Quando o empate
+    passa do teto, os escolhidos giram conforme o rid SIGA, para que linhas
+    iguais apontem para candidatos diferentes.
+    """
+    import numpy as np
+
+    k = min(k, EMPATES_MAX, matriz.shape[1])
+    corte = np.maximum(np.partition(matriz, matriz.shape[1] - k, axis=1)[:, -k], limiar)
+    mascara = matriz >= corte[:, None]
+    contagem = mascara.sum(axis=1)
+    excesso = np.flatnonzero(contagem > EMPATES_MAX)
+    mascara[excesso] = False
+    linhas, cols = np.nonzero(mascara)
+    if len(excesso) == 0:
+        return linhas, cols
+    extra_l, extra_c = [linhas], [cols]
+    for i in excesso:
+        row = matriz[i]
+        acima = np.flatnonzero(row > corte[i])
+        empatados = np.flatnonzero(row == corte[i])
+        m = EMPATES_MAX - len(acima)
+        escolhidos = empatados[(int(s_rid[i]) * m + np.arange(m)) % len(empatados)]
+        sel = np.concatenate([acima, escolhidos])
+        extra_l.append(np.full(len(sel), i))
+        extra_c.append(sel)
+    return np.concatenate(extra_l), np.concatenate(extra_c)
+
+def _gerar_candidatos(conn: sqlite3.Connection, dep: str, siga_sql: str, memoria_bytes: int, limiar: float,
+                      k: int = TOP_K) -> int:
+    """Grava em `candidatos` o top-k (score >= limiar, com empates) de cada SIGA de `siga_sql` contra o formulário livre da partição."""
+    import numpy as np
+    from rapidfuzz import fuzz, process
+
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM form WHERE dep = ? AND pareado = 0", (dep,))
+    n_form = cur.fetchone()[0]
+    if n_form == 0:
+        return 0
+    # metade do orçamento para textos do formulário, metade para textos SIGA + matriz
+    bloco_form = max(1, min(n_form, memoria_bytes // 2 // BYTES_POR_LINHA, BLOCO_FORM_MAX))
+    bloco_siga = max(1, memoria_bytes // 2 // (bloco_form * BYTES_POR_CELULA + BYTES_POR_LINHA))
+
+    def blocos_form():
+        form_cur = conn.cursor()
+        form_cur.execute("SELECT rid, texto FROM form WHERE dep = ? AND pareado = 0 ORDER BY rid", (dep,))
+        while True:
+            rows = form_cur.fetchmany(bloco_form)
+            if not rows:
+                break
+            yield np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)), [r[1] for r in rows]
+
+    # partição do formulário que cabe num bloco só: lê uma vez em vez de a cada bloco SIGA
+    form_unico = list(blocos_form()) if n_form <= bloco_form else None
+
+    n_cand = 0
+    siga_cur = conn.cursor()
+    siga_cur.execute(siga_sql, (dep,))
+    while True:
+        siga_rows = siga_cur.fetchmany(bloco_siga)
+        if not siga_rows:
+            break
+        s_rid = np.fromiter((r[0] for r in siga_rows), dtype=np.int64, count=len(siga_rows))
+        s_txt = [r[1] for r in siga_rows]
+        for f_rid, f_txt in (form_unico if form_unico is not None else blocos_form()):
+            matriz = process.cdist(s_txt, f_txt, scorer=fuzz.token_set_ratio,
+                                   dtype=np.float32, score_cutoff=limiar, workers=-1)
+            linhas, cols = _selecionar(matriz, s_rid, k, limiar)
+            cur.executemany(
+                "INSERT INTO candidatos (siga_rid, form_rid, score) VALUES (?,?,?)",
+                zip(s_rid[linhas].tolist(), f_rid[cols].tolist(), matriz[linhas, cols].tolist())
+            )
+            n_cand += len(linhas)
+    conn.commit()
+    return n_cand
+
+def _atribuir(conn: sqlite3.Connection) -> int:
+    """
+    Atribuição gulosa 1-para-1 sobre `candidatos`: maior score primeiro, desempate
+    pela ordem de leitura. As marcações vão para siga/form em blocos de BLOCO_PARES;
+    só os pares do bloco corrente ficam em memória.
+    """
+    cur = conn.cursor()
+    bloco_siga, bloco_form, pares = set(), set(), []
+    total = 0
+
+    def gravar():
+        cur.executemany("UPDATE siga SET par_form = ?, score = ?, origem = 'automatico' WHERE rid = ?", pares)
+        cur.executemany("UPDATE form SET pareado = 1 WHERE rid = ?", [(p[0],) for p in pares])
+        bloco_siga.clear()
+        bloco_form.clear()
+        pares.clear()
+
+    cand_cur = conn.cursor()
+    cand_cur.execute("SELECT siga_rid, form_rid, score FROM candidatos ORDER BY score DESC, siga_rid, form_rid")
+    for s, f, sc in cand_cur:
+        if s in bloco_siga or f in bloco_form:
+            continue
+        cur.execute("SELECT 1 FROM siga WHERE rid = ? AND par_form IS NULL", (s,))
+        if cur.fetchone() is None:
+            continue
+        cur.execute("SELECT 1 FROM form WHERE rid = ? AND pareado = 0", (f,))
+        if cur.fetchone() is None:
+            continue
+        bloco_siga.add(s)
+        bloco_form.add(f)
+        pares.append((f, round(sc, 1), s))
+        total += 1
+        if len(pares) >= BLOCO_PARES:
+            gravar()
+    gravar()
+    conn.commit()
+    return total
+
+def _parear_particao(conn: sqlite3.Connection, dep: str, memoria_bytes: int, limiar: float):
+    """Pareia a partição e retorna (pareados, rodadas de pontuação)."""
+    cur = conn.cursor()
+    cur.execute("DELETE FROM candidatos")
+    cur.execute("DELETE FROM pendentes")
+    total = _parear_identicos(conn, dep)
+    siga_sql = "SELECT rid, texto FROM siga WHERE dep = ? AND par_form IS NULL ORDER BY rid"
+    rodadas = 0
+    while _gerar_candidatos(conn, dep, siga_sql, memoria_bytes, limiar, TOP_K << rodadas):
+        rodadas += 1
+        n = _atribuir(conn)
+        total += n
+        # SIGA que tinham candidatos acima do limiar, mas todos foram tomados:
+        # nova rodada só com eles, contra o formulário que ainda está livre
+        cur.execute("DELETE FROM pendentes")
+        cur.execute("INSERT INTO pendentes (rid) SELECT DISTINCT c.siga_rid FROM candidatos c "
+                    "JOIN siga s ON s.rid = c.siga_rid WHERE s.par_form IS NULL")
+        pendentes = cur.rowcount
+        cur.execute("DELETE FROM candidatos")
+        conn.commit()
+        if n == 0 or pendentes == 0:
+            break
+        siga_sql = ("SELECT s.rid, s.texto FROM siga s JOIN pendentes p ON p.rid = s.rid "
+                    "WHERE s.dep = ? AND s.par_form IS NULL ORDER BY s.rid")
+    return total, rodadas
+
+class _Saidas:
+    """Três CSVs com o mesmo cabeçalho do export do app (SIGA__*, FORM__*, Status), escritos de forma incremental."""
+
+    def __init__(self, saida: Path, siga_cols: List[str], form_cols: List[str]):
+        self.siga_cols = siga_cols
+        self.form_cols = form_cols + ["codigo_form"]
+        self.header = ([f"SIGA__{c}" for c in self.siga_cols] + [f"FORM__{c}" for c in self.form_cols]
+                       + ["Status", "Score", "Origem"])
+        self.arquivos = {}
+        self.writers = {}
+        for nome in ("Pareados", "Somente_SIGA", "Somente_Formulario"):
+            f = open(saida / f"{nome}.csv", "w", newline="", encoding="utf-8-sig")
+            self.arquivos[nome] = f
+            self.writers[nome] = csv.writer(f)
+            self.writers[nome].writerow(self.header)
+        self.contagem = {nome: 0 for nome in self.arquivos}
+
+    def escrever(self, nome: str, siga_json, form_json, codigo_form, status, score="", origem=""):
+        s = json.loads(siga_json) if siga_json else {}
+        f = json.loads(form_json) if form_json else {}
+        if form_json:
+            f["codigo_form"] = codigo_form
+        self.writers[nome].writerow([s.get(c, "") for c in self.siga_cols] + [f.get(c, "") for c in self.form_cols]
+                                    + [status, "" if score is None else score, origem or ""])
+        self.contagem[nome] += 1
+
+    def fechar(self):
+        for f in self.arquivos.values():
+            f.close()
+
+def _exportar_particao(conn: sqlite3.Connection, saidas: _Saidas, dep: str, bloco: int):
+    cur = conn.cursor()
+    consultas = [
+        ("Pareados", "Pareado",
+         "SELECT s.dados, f.dados, f.codigo, s.score, s.origem FROM siga s JOIN form f ON f.rid = s.par_form "
+         "WHERE s.dep = ? ORDER BY s.rid"),
+        ("Somente_SIGA", "Somente_SIGA",
+         "SELECT dados, NULL, NULL, NULL, NULL FROM siga WHERE dep = ? AND par_form IS NULL ORDER BY rid"),
+        ("Somente_Formulario", "Somente_Formulario",
+         "SELECT NULL, dados, codigo, NULL, NULL FROM form WHERE dep = ? AND pareado = 0 ORDER BY rid"),
+    ]
+    for nome, status, sql in consultas:
+        cur.execute(sql, (dep,))
+        while True:
+            rows = cur.fetchmany(bloco)
+            if not rows:
+                break
+            for sj, fj, cf, sc, origem in rows:
+                saidas.escrever(nome, sj, fj, cf, status, sc, origem)
+
+def parear_fora_da_memoria(siga_path: Path, form_path: Path, saida: Path, memoria_mb: int = 512,
+                           limiar: float = 85.0, historico: Optional[Path] = None,
+                           bloco: int = 50_000, log=print) -> Dict[str, int]:
+    """
+    Executa o pareamento automático em disco. Retorna as contagens de cada saída.
+    O SQLite de trabalho (staging.db) fica em `saida` e é recriado a cada execução.
+    """
+    saida.mkdir(parents=True, exist_ok=True)
+    memoria_bytes = int(memoria_mb) * 1024 * 1024
+    conn = sqlite3.connect(str(saida / "staging.db"))
+    try:
+        conn.executescript("PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;")
+        conn.executescript(STAGING_SCHEMA)
+        t0 = time.perf_counter()
+        n_siga = _carregar_lado(conn, "siga", siga_path, SIGA_CANDIDATOS, bloco)
+        n_form = _carregar_lado(conn, "form", form_path, FORM_CANDIDATOS, bloco)
+        conn.executescript(STAGING_INDEXES)
+        _gerar_codigos_form(conn)
+        log(f"carregados SIGA={n_siga} Formulário={n_form} em {time.perf_counter() - t0:.1f}s")
+        if historico is not None and historico.exists():
+            log(f"pareamentos manuais aplicados: {_aplicar_manuais(conn, historico)}")
+
+        cur = conn.cursor()
+        cur.execute("SELECT nome FROM colunas WHERE lado = 'siga' ORDER BY posicao")
+        siga_cols = [r[0] for r in cur.fetchall()]
+        cur.execute("SELECT nome FROM colunas WHERE lado = 'form' ORDER BY posicao")
+        form_cols = [r[0] for r in cur.fetchall()]
+        cur.execute("SELECT dep FROM siga UNION SELECT dep FROM form ORDER BY 1")
+        deps = [r[0] for r in cur.fetchall()]
+
+        saidas = _Saidas(saida, siga_cols, form_cols)
+        try:
+            for i, dep in enumerate(deps, 1):
+                t = time.perf_counter()
+                n, rodadas = _parear_particao(conn, dep, memoria_bytes, limiar)
+                _exportar_particao(conn, saidas, dep, bloco)
+                log(f"[{i}/{len(deps)}] dependência '{dep or '(vazia)'}': {n} pareados "
+                    f"({rodadas} rodadas) em {time.perf_counter() - t:.1f}s")
+        finally:
+            saidas.fechar()
+        return dict(saidas.contagem)
+    finally:
+        conn.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pareamento automático fora da memória, particionado por dependência")
+    parser.add_argument("siga", type=Path, help="CSV do SIGA")
+    parser.add_argument("form", type=Path, help="CSV do formulário")
+    parser.add_argument("--saida", type=Path, required=True, help="pasta dos CSVs de saída e do staging.db")
+    parser.add_argument("--memoria-mb", type=int, default=512, help="orçamento de memória por partição (padrão: 512)")
+    parser.add_argument("--limiar", type=float, default=85.0, help="score mínimo para parear (0-100, padrão: 85)")
+    parser.add_argument("--historico", type=Path, default=None, help="history.db do projeto com pareamentos manuais")
+    parser.add_argument("--bloco", type=int, default=50_000, help="linhas por bloco de leitura/escrita")
+    args = parser.parse_args(argv)
+    contagem = parear_fora_da_memoria(args.siga, args.form, args.saida, args.memoria_mb, args.limiar,
+                                      args.historico, args.bloco)
+    for nome, n in contagem.items():
+        print(f"{nome}: {n} linhas")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+# utils/sugestoes.py
+# Sugestões automáticas (rapidfuzz) com cache persistente por projeto.
+#
+# O cache fica em projetos/<nome>/sugestoes.db, ao lado do history.db. As chaves
+# são hashes do texto normalizado dos dois lados, então renomear o código de um
+# item sem mudar o texto não invalida nada. Para cada texto SIGA guardamos o
+# top-k de textos do formulário e o "conjunto" (hash do universo de textos do
+# formulário) contra o qual ele foi calculado:
+#   - texto SIGA novo                      -> calcula contra todo o formulário
+#   - algum candidato do top-k sumiu       -> recalcula contra todo o formulário
+#   - só entraram textos novos no formulário -> pontua apenas os novos e mescla
+# O cálculo é gravado em blocos (um commit por bloco); uma execução interrompida
+# retoma dos textos SIGA que ainda não estão no conjunto atual. O cache é
+# compartilhado pelas sessões do projeto (cada operador pode carregar uma fatia
+# do inventário), então a limpeza é por uso: saem os textos SIGA não consultados
+# há RETENCAO_DIAS e, acima de MAX_TEXTOS_SIGA, os usados há mais tempo.
+import hashlib
+import sqlite3
+import time
+import unicodedata
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sugestoes (
+    siga_hash TEXT,
+    posicao INTEGER,
+    form_hash TEXT,
+    score REAL,
+    PRIMARY KEY (siga_hash, posicao)
+);
+CREATE TABLE IF NOT EXISTS sugestoes_estado (
+    siga_hash TEXT PRIMARY KEY,
+    conjunto TEXT NOT NULL,
+    usado_em REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS conjuntos (
+    conjunto TEXT,
+    form_hash TEXT,
+    PRIMARY KEY (conjunto, form_hash)
+);
+"""
+
+# limite de células da matriz de scores calculada de uma vez (float32)
+MAX_CELULAS = 20_000_000
+# limpeza do cache: idade máxima sem uso e teto de textos SIGA guardados
+RETENCAO_DIAS = 30
+MAX_TEXTOS_SIGA = 500_000
+
+Candidatos = List[Tuple[str, float]]
+
+def normalizar_texto(texto) -> str:
+    """Minúsculas, sem acentos e com espaços colapsados."""
+    texto = unicodedata.normalize("NFKD", "" if texto is None else str(texto))
+    texto = "".join(ch for ch in texto if not unicodedata.combining(ch))
+    return " ".join(texto.lower().split())
+
+def hash_texto(texto_normalizado: str) -> str:
+    return hashlib.sha1(texto_normalizado.encode("utf-8")).hexdigest()[:16]
+
+def _hash_conjunto(form_hashes: Iterable[str]) -> str:
+    return hashlib.sha1("\n".join(sorted(form_hashes)).encode("utf-8")).hexdigest()[:16]
+
+def _connect(cache_path: Path) -> sqlite3.Connection:
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(cache_path))
+    conn.executescript(CACHE_SCHEMA)
+    # caches criados antes da coluna usado_em
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(sugestoes_estado)")}
+    if "usado_em" not in cols:
+        conn.execute("ALTER TABLE sugestoes_estado ADD COLUMN usado_em REAL NOT NULL DEFAULT 0")
+        conn.commit()
+    return conn
+
+def _melhores(cands: Candidatos, k: int) -> Candidatos:
+    # desempate pelo hash para que mesclar incrementos dê o mesmo top-k que o cálculo completo
+    return sorted(cands, key=lambda c: (-c[1], c[0]))[:k]
+
+def _pontuar(consultas: List[str], escolhas: List[str], escolhas_hash: List[str], k: int) -> List[Candidatos]:
+    """Top-k de `escolhas` para cada texto em `consultas`, em blocos de até MAX_CELULAS."""
+    if not consultas:
+        return []
+    if not escolhas:
+        return [[] for _ in consultas]
+    import numpy as np
+    from rapidfuzz import fuzz, process
+
+    linhas = max(1, MAX_CELULAS // len(escolhas))
+    out = []
+    for i in range(0, len(consultas), linhas):
+        matriz = process.cdist(consultas[i:i + linhas], escolhas, scorer=fuzz.token_set_ratio,
+                               dtype=np.float32, workers=-1)
+        for row in matriz:
+            if len(escolhas) > k:
+                # pega o k-ésimo score e todos os empatados com ele, depois ordena
+                corte = np.partition(row, -k)[-k]
+                idx = np.flatnonzero(row >= corte)
+            else:
+                idx = range(len(escolhas))
+            out.append(_melhores([(escolhas_hash[j], round(float(row[j]), 1)) for j in idx], k))
+    return out
+
+def atualizar_sugestoes(cache_path: Path, siga_textos: Iterable[str], form_textos: Iterable[str],
+                        k: int = 5, bloco: int = 500,
+                        progresso: Optional[Callable[[int, int], None]] = None) -> Dict[str, Candidatos]:
+    """
+    Garante no cache o top-k de cada texto SIGA contra os textos do formulário
+    e retorna {siga_hash: [(form_hash, score), ...]} para os textos informados.
+    Os textos podem vir crus; a normalização e os hashes são feitos aqui.
+    `progresso(feitos, total)` é chamado após cada bloco gravado.
+    """
+    siga_norm = {hash_texto(t): t for t in (normalizar_texto(x) for x in siga_textos)}
+    form_norm = {hash_texto(t): t for t in (normalizar_texto(x) for x in form_textos)}
+    form_set = set(form_norm)
+    conjunto = _hash_conjunto(form_set)
+
+    conn = _connect(cache_path)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM conjuntos WHERE conjunto = ? LIMIT 1", (conjunto,))
+        if not cur.fetchone():
+            cur.executemany("INSERT OR IGNORE INTO conjuntos (conjunto, form_hash) VALUES (?,?)",
+                            [(conjunto, fh) for fh in form_set])
+            conn.commit()
+
+        cur.execute("SELECT siga_hash, conjunto FROM sugestoes_estado")
+        estado = {sh: cj for sh, cj in cur.fetchall() if sh in siga_norm}
+        pendentes = [sh for sh in siga_norm if estado.get(sh) != conjunto]
+
+        conjuntos_antigos: Dict[str, set] = {}
+        form_hashes = list(form_norm)
+        form_lista = [form_norm[fh] for fh in form_hashes]
+
+        for ini in range(0, len(pendentes), bloco):
+            chunk = pendentes[ini:ini + bloco]
+            resultado: Dict[str, Candidatos] = {}
+            completos = []
+            # separa o que dá para atualizar só com os textos novos do formulário
+            incrementais: Dict[str, List[str]] = {}
+            for sh in chunk:
+                anterior = estado.get(sh)
+                if anterior is None:
+                    completos.append(sh)
+                    continue
+                if anterior not in conjuntos_antigos:
+                    cur.execute("SELECT form_hash FROM conjuntos WHERE conjunto = ?", (anterior,))
+                    conjuntos_antigos[anterior] = {r[0] for r in cur.fetchall()}
+                antigo = conjuntos_antigos[anterior]
+                cur.execute("SELECT form_hash, score FROM sugestoes WHERE siga_hash = ? ORDER BY posicao", (sh,))
+                cached = cur.fetchall()
+                if not antigo or any(fh not in form_set for fh, _ in cached):
+                    completos.append(sh)
+                else:
+                    novos = tuple(sorted(form_set - antigo))
+                    incrementais.setdefault(novos, []).append(sh)
+                    resultado[sh] = [(fh, sc) for fh, sc in cached]
+
+            for sh, cands in zip(completos, _pontuar([siga_norm[sh] for sh in completos], form_lista, form_hashes, k)):
+                resultado[sh] = cands
+            for novos, shs in incrementais.items():
+                novos = list(novos)
+                extra = _pontuar([siga_norm[sh] for sh in shs], [form_norm[fh] for fh in novos], novos, k)
+                for sh, cands in zip(shs, extra):
+                    resultado[sh] = _melhores(resultado[sh] + cands, k)
+
+            cur.executemany("DELETE FROM sugestoes WHERE siga_hash = ?", [(sh,) for sh in chunk])
+            cur.executemany(
+                "INSERT INTO sugestoes (siga_hash, posicao, form_hash, score) VALUES (?,?,?,?)",
+                [(sh, pos, fh, sc) for sh in chunk for pos, (fh, sc) in enumerate(resultado[sh])]
+            )
+            agora = time.time()
+            cur.executemany("INSERT OR REPLACE INTO sugestoes_estado (siga_hash, conjunto, usado_em) VALUES (?,?,?)",
+                            [(sh, conjunto, agora) for sh in chunk])
+            conn.commit()
+            if progresso:
+                progresso(min(ini + bloco, len(pendentes)), len(pendentes))
+
+        # marca o uso dos textos desta chamada e limpa por idade/LRU; textos de
+        # outras fatias do inventário ficam enquanto forem usados
+        agora = time.time()
+        cur.execute("CREATE TEMP TABLE atuais (siga_hash TEXT PRIMARY KEY)")
+        cur.executemany("INSERT INTO atuais (siga_hash) VALUES (?)", [(sh,) for sh in siga_norm])
+        cur.execute("UPDATE sugestoes_estado SET usado_em = ? WHERE siga_hash IN (SELECT siga_hash FROM atuais)", (agora,))
+        cur.execute(
+            "DELETE FROM sugestoes_estado WHERE siga_hash NOT IN (SELECT siga_hash FROM atuais) AND ("
+            "usado_em < ? OR siga_hash IN (SELECT siga_hash FROM sugestoes_estado ORDER BY usado_em DESC LIMIT -1 OFFSET ?))",
+            (agora - RETENCAO_DIAS * 86400, MAX_TEXTOS_SIGA)
+        )
+        removidos = cur.rowcount
+        if removidos:
+            cur.execute("DELETE FROM sugestoes WHERE siga_hash NOT IN (SELECT siga_hash FROM sugestoes_estado)")
+        if pendentes or removidos:
+            cur.execute("DELETE FROM conjuntos WHERE conjunto NOT IN (SELECT DISTINCT conjunto FROM sugestoes_estado)")
+        conn.commit()
+
+        # só os textos desta chamada: linhas gravadas por outra sessão no meio-tempo ficam de fora
+        saida: Dict[str, Candidatos] = {sh: [] for sh in siga_norm}
+        cur.execute("SELECT siga_hash, form_hash, score FROM sugestoes "
+                    "WHERE siga_hash IN (SELECT siga_hash FROM atuais) ORDER BY siga_hash, posicao")
+        for sh, fh, sc in cur.fetchall():
+            saida[sh].append((fh, sc))
+        return saida
+    finally:
+        conn.close()
+
+def chave_entrada(siga_codigos: Dict[str, str], form_codigos: Dict[str, str]) -> str:
+    """Hash barato dos códigos e textos crus dos dois lados, para memorizar o resultado por upload."""
+    h = hashlib.sha1()
+    for mapa in (siga_codigos, form_codigos):
+        h.update("\x1f".join(f"{c}\x1e{t}" for c, t in mapa.items()).encode("utf-8"))
+        h.update(b"\x1d")
+    return h.hexdigest()
+
+def sugestoes_por_codigo(siga_codigos: Dict[str, str], form_codigos: Dict[str, str],
+                         cache: Dict[str, Candidatos]) -> Dict[str, List[Tuple[str, float]]]:
+    """
+    Traduz o resultado de atualizar_sugestoes para códigos:
+    siga_codigos/form_codigos mapeiam código -> texto cru;
+    retorna {codigo_siga: [(codigo_form, score), ...]}.
+    """
+    form_por_hash: Dict[str, List[str]] = {}
+    for codigo, texto in form_codigos.items():
+        form_por_hash.setdefault(hash_texto(normalizar_texto(texto)), []).append(codigo)
+    out = {}
+    for codigo, texto in siga_codigos.items():
+        cands = cache.get(hash_texto(normalizar_texto(texto)), [])
+        out[codigo] = [(cf, sc) for fh, sc in cands for cf in form_por_hash.get(fh, [])]
+    return out